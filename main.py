@@ -1,11 +1,29 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, shutil, json, requests, logging, time
+import os, io, re, orjson, httpx, logging, time, queue, tempfile, asyncio, hashlib, base64, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# One thread per tesseract instance; we parallelise across pages instead of inside OpenMP
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 from PIL import Image
+import numpy as np
+import cv2
 import pytesseract
-from pdf2image import convert_from_path
+import pypdfium2 as pdfium
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:  # fall back to the pytesseract CLI wrapper
+    PyTessBaseAPI = None
 
+from diskcache import Cache
+from tenacity import (
+    AsyncRetrying, RetryError, stop_after_attempt, wait_exponential_jitter,
+    retry_if_exception_type, retry_if_result,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,7 +32,7 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # 1️⃣ Enable CORS
 app.add_middleware(
@@ -25,111 +43,327 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 2️⃣ Ensure upload dir exists
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 3️⃣ OCR engine: a small pool of tesseract instances, each loading the language model once
+OCR_WORKERS = max(1, int(os.getenv("OCR_WORKERS", min(4, os.cpu_count() or 1))))
+# Shared by all requests, so OCR_WORKERS bounds concurrent tesseract work per process
+OCR_THREADPOOL = ThreadPoolExecutor(max_workers=OCR_WORKERS)
+OCR_DPI = int(os.getenv("OCR_DPI", 150))  # plenty for invoice text, ~44% fewer pixels than 200
+OCR_MAX_IMAGE_SIDE = 2000  # larger uploads are downscaled before recognition
+OCR_BATCH_MAX = 40  # pages per tesseract batch run (large image lists can hang tesseract)
+_PDFIUM_LOCK = threading.Lock()  # PDFium is not thread-safe; only rendering is serialised
+# LSTM-only engine, bills treated as one uniform text block, word lists not loaded.
+# Set OCR_LANG=eng_fast with eng_fast.traineddata under TESSDATA_PREFIX for the integer model.
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+_TESS_VARIABLES = {"load_system_dawg": "0", "load_freq_dawg": "0"}
+_TESS_CONFIG = "--oem 1 --psm 6 " + " ".join(f"-c {k}={v}" for k, v in _TESS_VARIABLES.items())
+
+if PyTessBaseAPI is None:
+    logging.info("tesserocr not available, falling back to pytesseract")
+
+# Created on first use, so every uvicorn worker process loads its own models
+_TESS_POOL = None
+_TESS_POOL_LOCK = threading.Lock()
+
+def _tess_pool() -> queue.Queue:
+    global _TESS_POOL
+    with _TESS_POOL_LOCK:
+        if _TESS_POOL is None:
+            pool = queue.Queue()
+            for _ in range(OCR_WORKERS):
+                pool.put(PyTessBaseAPI(
+                    lang=OCR_LANG, psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY, variables=_TESS_VARIABLES
+                ))
+            logging.info(f"Using tesserocr (in-process tesseract, {OCR_WORKERS} instances)")
+            _TESS_POOL = pool
+    return _TESS_POOL
+
+@contextmanager
+def _tess_api():
+    """Borrow a PyTessBaseAPI from the pool (instances are not thread-safe)"""
+    pool = _tess_pool()
+    api = pool.get()
+    try:
+        yield api
+    finally:
+        pool.put(api)
 
-def ocr_image(path: str) -> str:
-    return pytesseract.image_to_string(Image.open(path))
+def _preprocess(img: Image.Image) -> Image.Image:
+    """Grayscale + adaptive binarization: cleaner text and less layout work for tesseract"""
+    arr = np.asarray(img if img.mode == "L" else img.convert("L"))
+    th = cv2.adaptiveThreshold(
+        arr, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10
+    )
+    return Image.fromarray(th)
+
+def _ocr_pil(img: Image.Image) -> str:
+    img = _preprocess(img)
+    if PyTessBaseAPI is None:
+        return pytesseract.image_to_string(img, lang=OCR_LANG, config=_TESS_CONFIG)
+    with _tess_api() as api:
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+def _ocr_batch(pages: list, start: int, tmpdir: str) -> list:
+    """pytesseract fallback: OCR several pages with one tesseract process via an image list file"""
+    paths = []
+    for i, pg in enumerate(pages, start=start):
+        page_path = os.path.join(tmpdir, f"ocr_{i}.png")
+        _preprocess(pg).save(page_path)
+        paths.append(page_path)
+    list_path = os.path.join(tmpdir, f"ocr_list_{start}.txt")
+    with open(list_path, "w") as f:
+        f.write("\n".join(paths))
+    # tesseract ends every page with a form feed
+    texts = pytesseract.image_to_string(list_path, lang=OCR_LANG, config=_TESS_CONFIG).split("\x0c")
+    return (texts + [""] * len(pages))[:len(pages)]
+
+def ocr_image(content: bytes) -> str:
+    with Image.open(io.BytesIO(content)) as img:
+        # JPEGs are decoded straight to grayscale at reduced size; no-op for other formats
+        img.draft("L", (OCR_MAX_IMAGE_SIDE, OCR_MAX_IMAGE_SIDE))
+        img.thumbnail((OCR_MAX_IMAGE_SIDE, OCR_MAX_IMAGE_SIDE), Image.LANCZOS)
+        return OCR_THREADPOOL.submit(_ocr_pil, img).result()
+
+def ocr_pdf(content: bytes) -> str:
+    # Rasterize in-process with PDFium (no pdftoppm subprocess or image files)
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(content)
+        try:
+            pages = [
+                pdf[i].render(scale=OCR_DPI / 72, grayscale=True).to_pil()
+                for i in range(len(pdf))
+            ]
+        finally:
+            pdf.close()
+    if PyTessBaseAPI is not None:
+        texts = list(OCR_THREADPOOL.map(_ocr_pil, pages))
+    else:
+        # One tesseract process per chunk of pages instead of one per page
+        workers = max(1, min(OCR_WORKERS, len(pages)))
+        size = max(1, min(OCR_BATCH_MAX, -(-len(pages) // workers)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            batches = OCR_THREADPOOL.map(
+                lambda start: _ocr_batch(pages[start:start + size], start, tmpdir),
+                range(0, len(pages), size),
+            )
+            texts = [t for batch in batches for t in batch]
+    return "\n".join(
+        f"----- Page {i} -----\n" + t for i, t in enumerate(texts, start=1)
+    )
 
-def ocr_pdf(path: str) -> str:
-    pages = convert_from_path(path, dpi=200)
-    texts = []
-    for i, pg in enumerate(pages, start=1):
-        texts.append(f"----- Page {i} -----\n" + pytesseract.image_to_string(pg))
-    return "\n".join(texts)
+# 4️⃣ Blocking OCR runs here so it never stalls the event loop
+THREADPOOL = ThreadPoolExecutor(max_workers=4)
 
 # 5️⃣ Gemini API settings
 API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"  # Changed to more stable model
+PROMPT_VERSION = 6  # bump whenever the prompt/model changes so cached results are not reused
 
-def call_gemini_with_retry(prompt: str, max_retries: int = 3) -> dict:
-    """Call Gemini API with retry logic and better error handling"""
-    
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "temperature": 0.1,
-            "maxOutputTokens": 2048,
+# Static prompt around the bill; sent as separate parts so nothing is rebuilt per request
+_PROMPT_PREFIX = """
+Extract ALL relevant information from this bill/invoice and return ONLY a valid JSON object with the following structure:
+
+{
+    "business_name": "Name of the business/store",
+    "business_address": "Complete address",
+    "business_phone": "Phone number if available",
+    "bill_number": "Invoice/bill number",
+    "date": "Date in YYYY-MM-DD format",
+    "time": "Time if available",
+    "items": [
+        {
+            "name": "Item name",
+            "quantity": number,
+            "unit_price": number,
+            "total_price": number
         }
-    }
-    params = {"key": API_KEY}
-    headers = {"Content-Type": "application/json"}
+    ],
+    "subtotal": number,
+    "tax_amount": number,
+    "tax_percentage": number,
+    "discount": number,
+    "total_amount": number,
+    "payment_method": "Cash/Card/UPI etc",
+    "customer_info": "Customer details if available"
+}
+
+Bill:
+"""
+_PROMPT_SUFFIX = """
+Return ONLY the JSON object, no explanation or markdown formatting.
+"""
+_PROMPT_PREFIX_PART = {"text": _PROMPT_PREFIX}
+_PROMPT_SUFFIX_PART = {"text": _PROMPT_SUFFIX}
+_STRING = {"type": "STRING", "nullable": True}
+_NUMBER = {"type": "NUMBER", "nullable": True}
+_BILL_FIELDS = [
+    "business_name", "business_address", "business_phone", "bill_number", "date", "time",
+    "items", "subtotal", "tax_amount", "tax_percentage", "discount", "total_amount",
+    "payment_method", "customer_info",
+]
+# Gemini structured output: the response is the bill JSON itself
+BILL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "business_name": _STRING,
+        "business_address": _STRING,
+        "business_phone": _STRING,
+        "bill_number": _STRING,
+        "date": _STRING,
+        "time": _STRING,
+        "items": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": _STRING,
+                    "quantity": _NUMBER,
+                    "unit_price": _NUMBER,
+                    "total_price": _NUMBER,
+                },
+                "required": ["name", "quantity", "unit_price", "total_price"],
+                "propertyOrdering": ["name", "quantity", "unit_price", "total_price"],
+            },
+        },
+        "subtotal": _NUMBER,
+        "tax_amount": _NUMBER,
+        "tax_percentage": _NUMBER,
+        "discount": _NUMBER,
+        "total_amount": _NUMBER,
+        "payment_method": _STRING,
+        "customer_info": _STRING,
+    },
+    # Every key must be present (null when unknown) and in prompt order:
+    # the UI builds item columns from the first item and renders fields in response order
+    "required": _BILL_FIELDS,
+    "propertyOrdering": _BILL_FIELDS,
+}
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "maxOutputTokens": 1024,  # the bill JSON is ~500 tokens
+    "responseMimeType": "application/json",
+    "responseSchema": BILL_SCHEMA,
+}
+PROMPT_MAX_CHARS = 6000  # OCR text beyond this is noise for field extraction and only adds latency
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# "gemini": send the bill itself to Gemini; "tesseract": OCR locally and send only the text
+OCR_ENGINE = os.getenv("OCR_ENGINE", "gemini").lower()
+# Expected type per extension; only a hint, the file's magic bytes decide
+MIME_TYPES = {'.pdf': 'application/pdf', '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+
+# 6️⃣ Result cache keyed by file content hash, shared by all worker processes.
+# Entries hold customer details, so they expire (seconds; 0 disables caching).
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 24 * 60 * 60))
+RESULT_CACHE = Cache(
+    os.getenv("RESULT_CACHE_DIR", "cache"),
+    size_limit=64 * 1024 * 1024,
+    eviction_policy="least-recently-used",
+)
+
+# Shared client: keeps TLS connections to Gemini alive across requests
+_GEMINI_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=60,
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+)
+# Caps in-flight Gemini calls per worker (binds to the running loop on first use, Python 3.10+)
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONC", "8"))
+_GEMINI_SEM = asyncio.Semaphore(GEMINI_CONCURRENCY)
+
+@app.on_event("startup")
+async def warm_up_ocr():
+    # Load tesseract models in each worker up front when every request needs them
+    if OCR_ENGINE == "tesseract" and PyTessBaseAPI is not None:
+        await asyncio.get_running_loop().run_in_executor(THREADPOOL, _tess_pool)
+
+@app.on_event("shutdown")
+async def close_gemini_client():
+    await _GEMINI_CLIENT.aclose()
+    THREADPOOL.shutdown(wait=False)
+    OCR_THREADPOOL.shutdown(wait=False)
+
+async def _post_gemini(params: dict, body: bytes) -> httpx.Response:
+    # Only the request itself holds a slot, not the backoff between retries
+    async with _GEMINI_SEM:
+        return await _GEMINI_CLIENT.post(GEMINI_URL, params=params, headers=_JSON_HEADERS, content=body)
+
+def _log_gemini_retry(retry_state) -> None:
+    outcome = retry_state.outcome
+    if outcome.failed:
+        reason = type(outcome.exception()).__name__
+    else:
+        reason = f"HTTP {outcome.result().status_code}"
+    logging.warning(f"Gemini API call failed ({reason}), retrying in {retry_state.next_action.sleep:.1f} seconds...")
+
+async def call_gemini_with_retry(
+    parts: list, max_retries: int = 3, generation_config: dict = GENERATION_CONFIG
+) -> dict:
+    """Call Gemini API with jittered exponential backoff on timeouts, connection errors, 429 and 503"""
     
-    for attempt in range(max_retries):
-        try:
-            logging.info(f"Calling Gemini API (attempt {attempt + 1}/{max_retries})")
-            
-            resp = requests.post(
-                GEMINI_URL, 
-                params=params, 
-                headers=headers, 
-                json=payload, 
-                timeout=60  # Increased timeout
-            )
-            
-            # Log response details for debugging
-            logging.info(f"Gemini API response status: {resp.status_code}")
-            
-            if resp.status_code == 200:
-                return resp.json()
-            elif resp.status_code == 503:
-                logging.warning(f"Gemini API unavailable (503), retrying in {2 ** attempt} seconds...")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
-            elif resp.status_code == 429:
-                logging.warning(f"Rate limited (429), retrying in {5 * (attempt + 1)} seconds...")
-                if attempt < max_retries - 1:
-                    time.sleep(5 * (attempt + 1))
-                    continue
-            elif resp.status_code == 400:
-                # Bad request - likely API key or prompt issue
-                error_detail = resp.text
-                logging.error(f"Bad request to Gemini API: {error_detail}")
-                raise HTTPException(status_code=400, detail=f"Invalid API request: {error_detail}")
-            
-            resp.raise_for_status()
-            
-        except requests.exceptions.Timeout:
-            logging.warning(f"Timeout on attempt {attempt + 1}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
-        except requests.exceptions.ConnectionError:
-            logging.warning(f"Connection error on attempt {attempt + 1}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code in [503, 429] and attempt < max_retries - 1:
-                continue
-            raise
+    body = orjson.dumps({
+        "contents": [{"parts": parts}],
+        "generationConfig": generation_config,
+    })
+    params = {"key": API_KEY}
     
-    # If all retries failed
-    raise HTTPException(
-        status_code=503, 
-        detail="Gemini API is currently unavailable. Please try again later."
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(max_retries),
+        wait=wait_exponential_jitter(initial=1, max=30),
+        retry=(
+            retry_if_exception_type(httpx.TransportError)  # timeouts, connect errors, stale pooled connections
+            | retry_if_result(lambda r: r.status_code in (503, 429))
+        ),
+        before=lambda rs: logging.info(f"Calling Gemini API (attempt {rs.attempt_number}/{max_retries})"),
+        before_sleep=_log_gemini_retry,
     )
+    try:
+        resp = await retrying(_post_gemini, params, body)
+    except RetryError:
+        # If all retries failed
+        raise HTTPException(
+            status_code=503, 
+            detail="Gemini API is currently unavailable. Please try again later."
+        )
+    
+    # Log response details for debugging
+    logging.info(f"Gemini API response status: {resp.status_code}")
+    
+    if resp.status_code == 400:
+        # Bad request - likely API key or prompt issue
+        error_detail = resp.text
+        logging.error(f"Bad request to Gemini API: {error_detail}")
+        raise HTTPException(status_code=400, detail=f"Invalid API request: {error_detail}")
+    
+    resp.raise_for_status()
+    return resp.json()
+
+# First "{" to last "}" of the response
+_JSON_RE = re.compile(rb"\{.*\}", re.DOTALL)
 
 def extract_json_from_text(text: str) -> dict:
     """Extract and parse JSON from Gemini response with better error handling"""
     try:
-        # Try to find JSON block first
-        start = text.find("{")
-        end = text.rfind("}")
-        
-        if start == -1 or end == -1:
-            # If no JSON found, try to create structured data from text
-            logging.warning("No JSON found in response, attempting to structure data")
-            return {
-                "raw_response": text,
-                "error": "Could not extract structured data",
-                "suggestion": "The AI response did not contain valid JSON format"
-            }
+        # Structured output: normally the whole response is the JSON object
+        try:
+            parsed_json = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            parsed_json = None
         
-        json_str = text[start:end + 1]
-        parsed_json = json.loads(json_str)
+        if not isinstance(parsed_json, dict):
+            # Otherwise look for a JSON block inside the text
+            match = _JSON_RE.search(text.encode())
+            
+            if match is None:
+                # If no JSON found, try to create structured data from text
+                logging.warning("No JSON found in response, attempting to structure data")
+                return {
+                    "raw_response": text,
+                    "error": "Could not extract structured data",
+                    "suggestion": "The AI response did not contain valid JSON format"
+                }
+            
+            parsed_json = orjson.loads(match.group(0))
         
         # Validate that it's not empty
         if not parsed_json:
@@ -137,7 +371,7 @@ def extract_json_from_text(text: str) -> dict:
             
         return parsed_json
         
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logging.error(f"JSON decode error: {e}")
         return {
             "raw_response": text,
@@ -152,6 +386,73 @@ def extract_json_from_text(text: str) -> dict:
             "details": str(e)
         }
 
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK = 64 * 1024
+
+# Leading "magic" bytes of the formats we can process
+_MAGIC_TYPES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+def sniff_mime_type(head: bytes):
+    """MIME type of a file from its first bytes, or None if it is not a PDF/JPEG/PNG"""
+    for magic, mime_type in _MAGIC_TYPES:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+def read_upload(src) -> tuple:
+    """Read an upload into memory in 64KB chunks, aborting as soon as it exceeds the size limit
+    or its first chunk is not a PDF/JPEG/PNG.
+
+    Returns the content, a BLAKE2b digest of it and its sniffed MIME type.
+    """
+    size = 0
+    digest = hashlib.blake2b(digest_size=16)
+    buf = io.BytesIO()
+    chunk = src.read(UPLOAD_CHUNK)
+    mime_type = sniff_mime_type(chunk)
+    if mime_type is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported or corrupt file: content is not a PDF, PNG or JPEG"
+        )
+    while chunk:
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail="File size exceeds 10MB limit"
+            )
+        digest.update(chunk)
+        buf.write(chunk)
+        chunk = src.read(UPLOAD_CHUNK)
+    return buf.getvalue(), digest.hexdigest(), mime_type
+
+async def run_ocr(content: bytes, is_pdf: bool) -> str:
+    """OCR an upload on the thread pool, turning failures into a 400"""
+    try:
+        ocr = ocr_pdf if is_pdf else ocr_image
+        text = await asyncio.get_running_loop().run_in_executor(THREADPOOL, ocr, content)
+        
+        logging.info(f"OCR text length: {len(text)} chars")
+        
+        if not text.strip():
+            raise HTTPException(
+                status_code=400,
+                detail="No text could be extracted from the file. Please ensure the file contains readable text."
+            )
+        return text
+            
+    except Exception as e:
+        logging.error(f"OCR error: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to extract text from file: {str(e)}"
+        )
+
 @app.post("/upload")
 async def upload_bill(file: UploadFile = File(...)):
     try:
@@ -165,90 +466,49 @@ async def upload_bill(file: UploadFile = File(...)):
                 detail=f"Unsupported file type: {file_extension}. Allowed: {', '.join(allowed_extensions)}"
             )
         
-        # Validate file size (10MB limit)
-        file_size = 0
-        content = await file.read()
-        file_size = len(content)
+        # Read file (chunked; type sniffed and 10MB limit enforced while reading)
+        loop = asyncio.get_running_loop()
+        content, file_hash, mime_type = await loop.run_in_executor(None, read_upload, file.file)
         
-        if file_size > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400, 
-                detail="File size exceeds 10MB limit"
-            )
+        logging.info(f"Received {file.filename} ({len(content)} bytes, {mime_type})")
+        if MIME_TYPES[file_extension] != mime_type:
+            logging.warning(f"{file.filename} is actually {mime_type}, ignoring its extension")
         
-        # Save file
-        dest = os.path.join(UPLOAD_DIR, file.filename)
-        with open(dest, "wb") as buf:
-            buf.write(content)
-        
-        logging.info(f"Saved upload to {dest} ({file_size} bytes)")
-        
-        # OCR
-        try:
-            if file_extension == '.pdf':
-                text = ocr_pdf(dest)
-            else:
-                text = ocr_image(dest)
-            
-            logging.info(f"OCR text length: {len(text)} chars")
-            
-            if not text.strip():
-                raise HTTPException(
-                    status_code=400,
-                    detail="No text could be extracted from the file. Please ensure the file contains readable text."
-                )
-                
-        except Exception as e:
-            logging.error(f"OCR error: {e}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Failed to extract text from file: {str(e)}"
-            )
+        # Same bill seen before: skip OCR and Gemini entirely
+        cache_key = f"v{PROMPT_VERSION}:{OCR_ENGINE}:{file_hash}"
+        # diskcache is SQLite (and LRU bookkeeping writes even on reads): keep it off the event loop
+        cached = await loop.run_in_executor(None, RESULT_CACHE.get, cache_key)
+        if cached is not None:
+            logging.info(f"Cache hit for {file_hash}")
+            return ORJSONResponse(content=cached)
         
-        # Build enhanced Gemini prompt
-        prompt = f"""
-Extract ALL relevant information from this bill/invoice and return ONLY a valid JSON object with the following structure:
-
-{{
-    "business_name": "Name of the business/store",
-    "business_address": "Complete address",
-    "business_phone": "Phone number if available",
-    "bill_number": "Invoice/bill number",
-    "date": "Date in YYYY-MM-DD format",
-    "time": "Time if available",
-    "items": [
-        {{
-            "name": "Item name",
-            "quantity": number,
-            "unit_price": number,
-            "total_price": number
-        }}
-    ],
-    "subtotal": number,
-    "tax_amount": number,
-    "tax_percentage": number,
-    "discount": number,
-    "total_amount": number,
-    "payment_method": "Cash/Card/UPI etc",
-    "customer_info": "Customer details if available"
-}}
-
-Bill Text:
-{text}
-
-Return ONLY the JSON object, no explanation or markdown formatting.
-"""
+        is_pdf = mime_type == 'application/pdf'
+        if OCR_ENGINE == "tesseract":
+            text = await run_ocr(content, is_pdf)
+            if len(text) > PROMPT_MAX_CHARS:
+                logging.info(f"Truncating OCR text from {len(text)} to {PROMPT_MAX_CHARS} chars for Gemini")
+            bill = {"text": text[:PROMPT_MAX_CHARS]}
+        else:
+            # Gemini reads the image/PDF itself, no local OCR needed
+            text = None
+            bill = {"inlineData": {
+                "mimeType": mime_type,
+                "data": base64.b64encode(content).decode(),
+            }}
+        parts = [_PROMPT_PREFIX_PART, bill, _PROMPT_SUFFIX_PART]
 
         # Call Gemini API with retry logic
         try:
-            gem_response = call_gemini_with_retry(prompt)
+            gem_response = await call_gemini_with_retry(parts)
             gem_text = gem_response["candidates"][0]["content"]["parts"][0]["text"]
             logging.info(f"Gemini returned {len(gem_text)} chars")
             
         except Exception as e:
             logging.error(f"Gemini API error: {e}")
+            if text is None:
+                text = await run_ocr(content, is_pdf)
             # Return OCR text as fallback
-            return JSONResponse(
+            return ORJSONResponse(
                 content={
                     "error": "AI processing unavailable",
                     "message": "Extracted text only (AI service temporarily unavailable)",
@@ -260,21 +520,19 @@ Return ONLY the JSON object, no explanation or markdown formatting.
         
         # Extract and parse JSON
         extracted_data = extract_json_from_text(gem_text)
-        
-        # Clean up uploaded file (optional)
-        try:
-            os.remove(dest)
-        except:
-            pass
+        if "error" not in extracted_data and RESULT_CACHE_TTL > 0:
+            await loop.run_in_executor(
+                None, RESULT_CACHE.set, cache_key, extracted_data, RESULT_CACHE_TTL
+            )
             
-        return JSONResponse(content=extracted_data)
+        return ORJSONResponse(content=extracted_data)
         
     except HTTPException as he:
         logging.error(f"HTTPException: {he.detail}")
         raise he
     except Exception as e:
         logging.exception("Unhandled error in /upload")
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "error": "Internal server error",
                 "message": str(e),
@@ -292,11 +550,16 @@ async def health_check():
 async def test_gemini():
     """Test Gemini API connectivity"""
     try:
-        test_response = call_gemini_with_retry("Hello, respond with: {\"status\": \"working\"}")
+        test_response = await call_gemini_with_retry(
+            [{"text": "Hello, respond with: {\"status\": \"working\"}"}],
+            generation_config={"temperature": 0.1, "maxOutputTokens": 64},
+        )
         return {"gemini_status": "connected", "response": test_response}
     except Exception as e:
         return {"gemini_status": "error", "error": str(e)}
 
 if __name__ == "__main__":
     import uvicorn
+    # Single process for local development; for several workers run
+    # `uvicorn main:app --workers N` so each worker imports this module only once
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file